@@ -0,0 +1,63 @@
+"""
+Builds minimax.json, the table of optimal moves used by tictactoe.minimax.
+
+Usage: python build_table.py
+"""
+
+import json
+
+import tictactoe as ttt
+
+
+def decode(key):
+    """
+    Returns the board for a 9 character board key.
+    """
+
+    cells = [ttt.EMPTY if cell == "." else cell for cell in key]
+    return tuple(cells[0:3]), tuple(cells[3:6]), tuple(cells[6:9])
+
+
+def build_table():
+    """
+    Returns a dictionary mapping the canonical key of every reachable non-terminal board to the optimal
+    action (i, j) on the canonical board.
+    """
+
+    table = {}
+    seen = set()
+    stack = [ttt.initial_state()]
+
+    while stack:
+        board = stack.pop()
+        key, _ = ttt._encode(board)
+
+        # symmetric boards share the same canonical key, only visit one of them
+        if key in seen:
+            continue
+        seen.add(key)
+
+        if ttt.terminal(board):
+            continue
+
+        canonical = decode(key)
+        _, action = ttt.alphabeta(canonical, ttt.player(canonical))
+        table[key] = action
+
+        for action in ttt.actions(canonical):
+            stack.append(ttt.result(canonical, action))
+
+    return table
+
+
+def main():
+    table = build_table()
+
+    with open(ttt.TABLE_FILE, "w") as f:
+        json.dump(table, f, sort_keys=True)
+
+    print(f"Wrote {len(table)} boards to {ttt.TABLE_FILE}")
+
+
+if __name__ == "__main__":
+    main()
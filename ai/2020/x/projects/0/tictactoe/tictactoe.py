@@ -2,49 +2,85 @@
 Tic Tac Toe Player
 """
 
+import json
+import os
+
 X = "X"
 O = "O"
 EMPTY = None
 positive_infinity = float('inf')
 negative_infinity = float('-inf')
 
+# Board cell index permutations for the 8 symmetries of the board (4 rotations x reflection), cell k of the
+# transformed board is cell SYMMETRIES[n][k] of the original board
+_ROTATE = (6, 3, 0, 7, 4, 1, 8, 5, 2)
+_REFLECT = (2, 1, 0, 5, 4, 3, 8, 7, 6)
+SYMMETRIES = [tuple(range(9))]
+for _ in range(3):
+    SYMMETRIES.append(tuple(SYMMETRIES[-1][k] for k in _ROTATE))
+SYMMETRIES += [tuple(symmetry[k] for k in _REFLECT) for symmetry in SYMMETRIES]
+
+# Precomputed optimal moves keyed by canonical board, generated by build_table.py
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "minimax.json")
+
+# Bitboards: the search represents a board as a pair of 9 bit masks (x, o) where bit i * 3 + j is set when
+# that player holds cell (i, j)
+FULL_MASK = 0x1FF
+WIN_MASKS = [
+    0b111000000, 0b000111000, 0b000000111,  # rows
+    0b100100100, 0b010010010, 0b001001001,  # columns
+    0b100010001, 0b001010100                # diagonals
+]
+
+# There are only 512 masks, so answer the per node questions of the search with table lookups instead of loops:
+# _WINS[mask] is True when the mask holds a line and _BITS[empty] is the tuple of single bits set in the mask
+_WINS = [any((mask & w) == w for w in WIN_MASKS) for mask in range(FULL_MASK + 1)]
+_BITS = [tuple(1 << k for k in range(9) if mask >> k & 1) for mask in range(FULL_MASK + 1)]
+
+# Bit permutation tables for the board symmetries, _PERMUTED[n][mask] is the mask transformed by SYMMETRIES[n] and
+# _RESTORED[n][mask] transforms it back
+_PERMUTED = [
+    [sum(1 << k for k in range(9) if mask >> symmetry[k] & 1) for mask in range(FULL_MASK + 1)]
+    for symmetry in SYMMETRIES
+]
+_RESTORED = [
+    [sum(1 << symmetry[k] for k in range(9) if mask >> k & 1) for mask in range(FULL_MASK + 1)]
+    for symmetry in SYMMETRIES
+]
+
+# Transposition table of searched bitboards, (x, o) -> (value, bound, best bit), keyed by the canonical bitboard
+# across all board symmetries. A search cut off by alpha-beta only knows a bound on the value of a board, so the
+# bound kind is stored alongside the value
+EXACT = 0
+LOWER = 1
+UPPER = 2
+_transpositions = {}
+
+
 def initial_state():
     """
     Returns starting state of the board.
+
+    Boards are immutable tuples of row tuples (lists of lists are accepted
+    everywhere a board is), so boards can share unchanged rows and be hashed.
     """
-    return [[EMPTY, EMPTY, EMPTY],
-            [EMPTY, EMPTY, EMPTY],
-            [EMPTY, EMPTY, EMPTY]]
+    return ((EMPTY, EMPTY, EMPTY),
+            (EMPTY, EMPTY, EMPTY),
+            (EMPTY, EMPTY, EMPTY))
 
 
 def player(board):
     """
     Returns player who has the next turn on a board.
     """
-
-    current = "X"
-
-    for i in range(3):
-        for j in range(3):
-            if board[i][j] != EMPTY:
-                current = "O" if current == "X" else "X"
-
-    return current
+    return _player(*_to_bitboard(board))
 
 
 def actions(board):
     """
     Returns set of all possible actions (i, j) available on the board.
     """
-
-    actions = set()
-
-    for i in range(3):
-        for j in range(3):
-            if not board[i][j]:
-                actions.add((i, j))
-
-    return actions
+    return {_to_action(bit) for bit in _actions(*_to_bitboard(board))}
 
 
 def result(board, action):
@@ -55,58 +91,33 @@ def result(board, action):
     if action is None:
         return board
 
-    newBoard = [[None, None, None],[None, None, None],[None, None, None]]
-
-    for i in range(3):
-        for j in range(3):
-            newBoard[i][j] = board[i][j]
-
     i, j = action
-    newBoard[i][j] = player(board)
-    return newBoard
+    row = board[i]
+    newRow = (*row[:j], player(board), *row[j + 1:])
+
+    # Only the changed row is new, the other rows are shared with the board (tuple() of a tuple is the tuple)
+    return tuple(newRow if r == i else tuple(board[r]) for r in range(3))
 
 
 def winner(board):
     """
     Returns the winner of the game, if there is one.
     """
-
-    for i in range(3):
-        if board[i][0] is not None and board[i][0] == board[i][1] == board[i][2]:
-            return board[i][0]
-
-        if board[0][i] is not None and board[0][i] == board[1][i] == board[2][i]:
-            return board[0][i]
-
-    if board[0][0] is not None and board[0][0] == board[1][1] == board[2][2]:
-        return board[0][0]
-
-    if board[0][2] is not None and board[2][0] == board[1][1] == board[0][2]:
-        return board[0][2]
-
-    return None
+    return _winner(*_to_bitboard(board))
 
 
 def terminal(board):
     """
     Returns True if game is over, False otherwise.
     """
-    return utility(board) != 0 or len(actions(board)) == 0
+    return _terminal(*_to_bitboard(board))
 
 
 def utility(board):
     """
     Returns 1 if X has won the game, -1 if O has won, 0 otherwise.
     """
-
-    w = winner(board)
-
-    if w == "X":
-        return 1
-    elif w == "O":
-        return -1
-
-    return 0
+    return _utility(*_to_bitboard(board))
 
 
 def minimax(board):
@@ -117,72 +128,232 @@ def minimax(board):
     if terminal(board):
         return None
 
-    current = player(board)
-    # printboard(board)
+    # Take an immediate win, otherwise block the opponent's immediate win, before looking any deeper
+    x, o = _to_bitboard(board)
+    mine, theirs = (x, o) if _player(x, o) == X else (o, x)
+    empty_bits = _actions(x, o)
 
-    best_actions = None
-    action_list = actions(board)
+    for bit in empty_bits:
+        if _WINS[mine | bit]:
+            return _to_action(bit)
 
-    for action in action_list:
+    for bit in empty_bits:
+        if _WINS[theirs | bit]:
+            return _to_action(bit)
 
-        state = result(board, action)
-        max_value = maxValue(state)
-        min_value = minValue(state)
+    key, symmetry = _encode(board)
+    if key in _TABLE:
+        i, j = _TABLE[key]
+        return divmod(symmetry[i * 3 + j], 3)
 
-        if current == "X":
+    _, action = alphabeta(board, player(board))
+    return action
 
-            if max_value == 1 and min_value == 0:
-                best_actions = action
-                break
 
-            if max_value == min_value == 0:
-                best_actions = action
+def alphabeta(board, current_player):
+    """
+    Returns a (value, action) pair for `current_player` on the board using a
+    single alpha-beta search rooted at the board.
+    """
 
-            if max_value == min_value == 1:
-                best_actions = action
+    x, o = _to_bitboard(board)
 
-        elif current == "O":
+    if current_player == X:
+        value, bit = maxValue(x, o, negative_infinity, positive_infinity)
+    else:
+        value, bit = minValue(x, o, negative_infinity, positive_infinity)
 
-            if max_value == 0 and min_value == -1:
-                best_actions = action
-                break
+    return value, None if bit is None else _to_action(bit)
 
-            if max_value == min_value == 0:
-                best_actions = action
 
-            if max_value == min_value == -1:
-                best_actions = action
+def minValue(x, o, alpha=negative_infinity, beta=positive_infinity):
 
-        # print(f"{action}, player {current} {best_actions} max: {max_value} min: {min_value}")
+    if _terminal(x, o):
+        return _utility(x, o), None
 
-    # print(f"choice: {best_actions}")
-    return best_actions
+    key, symmetry = _canonical(x, o)
+    entry = _probe(key, symmetry, alpha, beta)
+    if entry is not None:
+        return entry
 
+    window = alpha, beta
+    best_bit = None
 
-def minValue(board):
+    v = positive_infinity
 
-    if terminal(board):
-        return utility(board)
+    # O is always the player to move in a min node
+    for bit in _actions(x, o):
+        value, _ = maxValue(x, o | bit, alpha, beta)
 
-    v = positive_infinity
+        if value < v:
+            v = value
+            best_bit = bit
 
-    for action in actions(board):
-        v = min(v, maxValue(result(board, action)))
+        # MAX already has a better option elsewhere, stop exploring this branch
+        beta = min(beta, v)
+        if alpha >= beta:
+            break
 
-    return v
+    _store(key, symmetry, window, v, best_bit)
+    return v, best_bit
 
 
-def maxValue(board):
+def maxValue(x, o, alpha=negative_infinity, beta=positive_infinity):
 
-    if terminal(board):
-        return utility(board)
+    if _terminal(x, o):
+        return _utility(x, o), None
+
+    key, symmetry = _canonical(x, o)
+    entry = _probe(key, symmetry, alpha, beta)
+    if entry is not None:
+        return entry
+
+    window = alpha, beta
+    best_bit = None
 
     v = negative_infinity
 
-    for action in actions(board):
-        v = max(v, minValue(result(board, action)))
+    # X is always the player to move in a max node
+    for bit in _actions(x, o):
+        value, _ = minValue(x | bit, o, alpha, beta)
+
+        if value > v:
+            v = value
+            best_bit = bit
+
+        # MIN already has a better option elsewhere, stop exploring this branch
+        alpha = max(alpha, v)
+        if alpha >= beta:
+            break
+
+    _store(key, symmetry, window, v, best_bit)
+    return v, best_bit
+
+
+def _canonical(x, o):
+    """
+    Returns the canonical (x, o) bitboard across all board symmetries, along with the index of the symmetry that
+    transforms the bitboard into it.
+    """
+    return min(((permuted[x], permuted[o]), n) for n, permuted in enumerate(_PERMUTED))
+
+
+def _probe(key, symmetry, alpha, beta):
+    """
+    Returns the (value, best bit) pair stored in the transposition table for the canonical bitboard `key` if it
+    settles a search within the (alpha, beta) window, None otherwise. The best bit is transformed back from the
+    canonical bitboard by `symmetry`.
+    """
+
+    entry = _transpositions.get(key)
+    if entry is None:
+        return None
+
+    value, bound, bit = entry
+
+    if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+        return value, None if bit is None else _RESTORED[symmetry][bit]
+
+    return None
+
+
+def _store(key, symmetry, window, v, best_bit):
+    """
+    Stores the searched value of the canonical bitboard `key` in the transposition table along with the kind of
+    bound the value is given the (alpha, beta) window it was searched with. The best bit is transformed onto the
+    canonical bitboard by `symmetry`.
+    """
+
+    alpha, beta = window
+
+    if v <= alpha:
+        bound = UPPER
+    elif v >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+
+    _transpositions[key] = (v, bound, None if best_bit is None else _PERMUTED[symmetry][best_bit])
+
+
+def _to_bitboard(board):
+    """
+    Returns the (x, o) bitboard pair for a board.
+    """
+
+    x = o = 0
+
+    for i in range(3):
+        for j in range(3):
+            if board[i][j] == X:
+                x |= 1 << (i * 3 + j)
+            elif board[i][j] == O:
+                o |= 1 << (i * 3 + j)
+
+    return x, o
+
+
+def _to_action(bit):
+    """
+    Returns the action (i, j) for a single bit of a bitboard.
+    """
+    return divmod(bit.bit_length() - 1, 3)
+
+
+def _player(x, o):
+    return X if (x | o).bit_count() % 2 == 0 else O
+
+
+def _actions(x, o):
+    """
+    Returns the bit of every empty cell on the bitboard.
+    """
+    return _BITS[~(x | o) & FULL_MASK]
+
+
+def _winner(x, o):
+
+    if _WINS[x]:
+        return X
+
+    if _WINS[o]:
+        return O
+
+    return None
+
+
+def _terminal(x, o):
+    return _WINS[x] or _WINS[o] or (x | o) == FULL_MASK
+
+
+def _utility(x, o):
+    # True - False is 1, False - True is -1 and no winner is 0, without branching on the winner
+    return _WINS[x] - _WINS[o]
+
+
+def _encode(board):
+    """
+    Returns the canonical 9 character key for the board (rows flattened, "." for EMPTY) across all board
+    symmetries, along with the symmetry used to map a cell on the canonical board back onto the board.
+    """
+
+    cells = [cell or "." for row in board for cell in row]
+    return min(("".join(cells[k] for k in symmetry), symmetry) for symmetry in SYMMETRIES)
+
+
+def _load_table():
+    """
+    Returns the precomputed move table, or an empty table if it has not been built.
+    """
+
+    if not os.path.exists(TABLE_FILE):
+        return {}
+
+    with open(TABLE_FILE) as f:
+        return json.load(f)
+
 
-    return v
+_TABLE = _load_table()
 
 
 def printboard(board):
@@ -1,8 +1,29 @@
+import collections
 import functools
 import itertools
 import random
 
 
+def neighbor_table(height, width):
+    """
+    Returns a table where table[i][j] is the list of cells within one row
+    and column of cell (i, j) that are on the board, not including the
+    cell itself.
+    """
+    return [
+        [
+            [
+                (y, x)
+                for y in range(max(0, i - 1), min(height, i + 2))
+                for x in range(max(0, j - 1), min(width, j + 2))
+                if (y, x) != (i, j)
+            ]
+            for j in range(width)
+        ]
+        for i in range(height)
+    ]
+
+
 class Minesweeper():
     """
     Minesweeper game representation
@@ -34,6 +55,13 @@ class Minesweeper():
         # At first, player has found no mines
         self.mines_found = set()
 
+        # Mines never move, so count the nearby mines of every cell once
+        neighbors = neighbor_table(height, width)
+        self._counts = [
+            [sum(self.board[y][x] for y, x in neighbors[i][j]) for j in range(width)]
+            for i in range(height)
+        ]
+
     def print(self):
         """
         Prints a text-based representation
@@ -60,23 +88,8 @@ class Minesweeper():
         not including the cell itself.
         """
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+        i, j = cell
+        return self._counts[i][j]
 
     def won(self):
         """
@@ -93,31 +106,47 @@ class Sentence():
     """
 
     def __init__(self, cells, count):
-        self.cells = set(cells)
+        self.cells = frozenset(cells)
         self.count = count
 
+        # Cached result of classify(), cleared whenever the sentence changes
+        self._classification = None
+
     def __eq__(self, other):
         return self.cells == other.cells and self.count == other.count
 
+    def __hash__(self):
+        return hash((self.cells, self.count))
+
     def __str__(self):
         return f"{self.cells} = {self.count}"
 
+    def classify(self):
+        """
+        Returns a (mines, safes) pair of the sets of all cells in self.cells
+        known to be mines and known to be safe.
+        """
+        if self._classification is None:
+            if self.count == len(self.cells) and self.count > 0:
+                self._classification = (self.cells, frozenset())
+            elif self.count == 0:
+                self._classification = (frozenset(), self.cells)
+            else:
+                self._classification = (frozenset(), frozenset())
+
+        return self._classification
+
     def known_mines(self):
         """
         Returns the set of all cells in self.cells known to be mines.
         """
-        if self.count == len(self.cells) and self.count > 0:
-            return self.cells
-
-        return set()
+        return self.classify()[0]
 
     def known_safes(self):
         """
         Returns the set of all cells in self.cells known to be safe.
         """
-        if self.count == 0:
-            return self.cells
-        return set()
+        return self.classify()[1]
 
     def mark_mine(self, cell):
         """
@@ -126,7 +155,8 @@ class Sentence():
         """
         if cell not in self.cells:
             self.count += 1
-            self.cells.add(cell)
+            self.cells = self.cells | {cell}
+            self._classification = None
 
     def mark_safe(self, cell):
         """
@@ -134,7 +164,8 @@ class Sentence():
         a cell is known to be safe.
         """
         if cell in self.cells:
-            self.cells.remove(cell)
+            self.cells = self.cells - {cell}
+            self._classification = None
 
 
 class MinesweeperAI():
@@ -155,26 +186,98 @@ class MinesweeperAI():
         self.mines = set()
         self.safes = set()
 
-        # List of sentences about the game known to be true
-        self.knowledge = []
+        # The inference engine works on flat cell indexes (i * width + j), track the same cells as
+        # masks indexed by cell index so membership checks don't need to hash a tuple
+        self._moves_made_mask = bytearray(height * width)
+        self._safes_mask = bytearray(height * width)
+
+        # Cells that can be chosen by a random move (not chosen yet and not known to be mines), and the safe
+        # cells in the order they were found, which may have been chosen since
+        self._available_mask = bytearray(b"\x01" * (height * width))
+        self._safe_moves = collections.deque()
+
+        # Sentences about the game known to be true, kept as the keys of a
+        # dictionary so duplicate sentences are merged when added
+        self.knowledge = {}
+
+        # Precompute the in bounds neighbors of every cell index
+        self._neighbors = [
+            [self._pack(neighbor) for neighbor in cells]
+            for row in neighbor_table(height, width)
+            for cells in row
+        ]
+
+    def _pack(self, cell):
+        """
+        Returns the flat index of a (row, col) cell.
+        """
+        (row, col) = cell
+        return row * self.width + col
+
+    def _unpack(self, index):
+        """
+        Returns the (row, col) cell of a flat index.
+        """
+        return divmod(index, self.width)
 
     def mark_mine(self, cell):
         """
         Marks a cell as a mine, and updates all knowledge
         to mark that cell as a mine as well.
         """
-        self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
+        self._mark_mine(self._pack(cell))
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
         """
-        self.safes.add(cell)
+        self._mark_safe(self._pack(cell))
+
+    def _mark_mine(self, index):
+        self.mines.add(self._unpack(index))
+        self._available_mask[index] = 0
+        sentences = list(self.knowledge)
+        for sentence in sentences:
+            sentence.mark_mine(index)
+
+        # marking changes the hash of sentences, rebuild the knowledge base
+        # (merging any sentences that are now equal)
+        self.knowledge = dict.fromkeys(sentences)
+
+    def _mark_safe(self, index):
+        if not self._safes_mask[index]:
+            self._safe_moves.append(index)
+
+        self.safes.add(self._unpack(index))
+        self._safes_mask[index] = 1
+        sentences = list(self.knowledge)
+        for sentence in sentences:
+            sentence.mark_safe(index)
+
+        # marking changes the hash of sentences, rebuild the knowledge base
+        # (merging any sentences that are now equal)
+        self.knowledge = dict.fromkeys(sentences)
+
+    def _mark_known(self):
+        """
+        Marks every cell the knowledge base concludes is a mine or safe, in a
+        single pass over the knowledge before marking any of them.
+        """
+
+        mines = set()
+        safes = set()
+
         for sentence in self.knowledge:
-            sentence.mark_safe(cell)
+            sentence_mines, sentence_safes = sentence.classify()
+            mines |= sentence_mines
+            safes |= sentence_safes
+
+        for index in mines:
+            self._mark_mine(index)
+
+        for index in safes:
+            self._mark_safe(index)
 
     def get_surrounding_cells(self, cell):
         """
@@ -182,24 +285,23 @@ class MinesweeperAI():
         are not currently known if they are a mine or safe cell. Knowledge will
         be used to deduce the state of the cell
         """
+        return {self._unpack(index) for index in self._surrounding_indexes(self._pack(cell))}
 
-        (row, col) = cell
-
-        row1 = row - 1 if row > 0 else 0
-        row2 = row + 1 if row < self.height - 1 else self.height - 1
-
-        col1 = col - 1 if col > 0 else 0
-        col2 = col + 1 if col < self.width - 1 else self.width - 1
+    def _surrounding_indexes(self, index):
 
-        cells = set()
-        for i in range(row1, row2 + 1, 1):
-            for j in range(col1, col2 + 1, 1):
-                surrounding_cell = (i, j)
-                # only want surrounding cells that are not known as safe
-                if surrounding_cell != cell and surrounding_cell not in self.safes:
-                    cells.add(surrounding_cell)
+        # only want surrounding cells that are not known as safe
+        return {
+            surrounding_index
+            for surrounding_index in self._neighbors[index]
+            if not self._safes_mask[surrounding_index]
+        }
 
-        return cells
+    def _describe(self, sentence):
+        """
+        Returns a sentence of the knowledge base as text, with its cell indexes
+        shown as (row, col) cells.
+        """
+        return f"{set(map(self._unpack, sentence.cells))} = {sentence.count}"
 
     def log_minefield(self, grid, title):
         print()
@@ -220,32 +322,29 @@ class MinesweeperAI():
         grid = [['-'] * self.width for i in range(self.height)]
 
         for sentence in self.knowledge:
-            for cell in sentence.cells:
-                (y, x) = cell
+            for index in sentence.cells:
+                (y, x) = self._unpack(index)
                 if grid[y][x] == "-":
                     grid[y][x] = sentence.count
 
-            for cell in sentence.known_safes():
-                (y, x) = cell
+            for index in sentence.known_safes():
+                (y, x) = self._unpack(index)
                 grid[y][x] = "S"
-            for cell in sentence.known_mines():
-                (y, x) = cell
+            for index in sentence.known_mines():
+                (y, x) = self._unpack(index)
                 grid[y][x] = "M"
 
         self.log_minefield(grid, "KNOWLEDGE")
 
         for sentence1 in self.knowledge:
-            print(sentence1)
+            print(self._describe(sentence1))
 
     def log_cells(self, cells, title, symbol="*"):
 
         grid = [['-'] * self.width for i in range(self.height)]
 
-        for y in range(0, self.height):
-            for x in range(0, self.width):
-                cell = (y, x)
-                if cell in cells:
-                    grid[y][x] = symbol
+        for (y, x) in cells:
+            grid[y][x] = symbol
 
         self.log_minefield(grid, title)
 
@@ -281,53 +380,51 @@ class MinesweeperAI():
                if they can be inferred from existing knowledge
         """
 
-        surrounding_cells = self.get_surrounding_cells(cell)
+        index = self._pack(cell)
+        surrounding_indexes = self._surrounding_indexes(index)
 
         # 1) mark the cell as a move that has been made
         self.moves_made.add(cell)
+        self._moves_made_mask[index] = 1
+        self._available_mask[index] = 0
         # 2) mark the cell as safe
-        self.mark_safe(cell)
+        self._mark_safe(index)
         # 3 / add a new sentence to the AI's knowledge base based on the value of `cell` and `count`
-        self.knowledge.append(Sentence(surrounding_cells, count))
+        self.knowledge[Sentence(surrounding_indexes, count)] = None
 
         # 4) mark any additional cells as safe or as mines if it can be concluded based on the AI's knowledge base
-        for sentence in self.knowledge:
-            for cell1 in sentence.known_mines().copy():
-                self.mark_mine(cell1)
-
-        for sentence in self.knowledge:
-            for cell1 in sentence.known_safes().copy():
-                self.mark_safe(cell1)
+        self._mark_known()
 
         # if count = 0 then all surrounding cells are safe
         if count == 0:
-            for x in surrounding_cells:
-                self.mark_safe(x)
+            for x in surrounding_indexes:
+                self._mark_safe(x)
 
         # 5) add any new sentences to the AI's knowledge base if they can be inferred from existing knowledge
         # Notes: More generally, any time we have two sentences set1 = count1 and set2 = count2 where set1 is
         # a subset of set2, then we can construct the new sentence set2 - set1 = count2 - count1.
-        for sentence1 in self.knowledge:
-            for sentence2 in self.knowledge:
-                if sentence1 is sentence2:
-                    continue
-                elif sentence1 == sentence2:
-                    self.knowledge.remove(sentence2)
-                elif sentence1.cells.issubset(sentence2.cells):
-                    new_knowledge = Sentence(sentence2.cells - sentence1.cells, sentence2.count - sentence1.count)
-                    if new_knowledge not in self.knowledge:
-                        print(f"Adding knowledge: {new_knowledge}")
-                        self.knowledge.append(new_knowledge)
-
-        for sentence in self.knowledge:
-            for cell1 in sentence.known_mines().copy():
-                self.mark_mine(cell1)
-
-        for sentence in self.knowledge:
-            for cell1 in sentence.known_safes().copy():
-                self.mark_safe(cell1)
-
-        # self.log_cells(surrounding_cells, f"MOVE {cell} {count}")
+        # Duplicate sentences are already merged by the knowledge base, so visit each pair of sentences once
+        # (checking the subset both ways), collect the inferred sentences and add them once the scan is done
+        # rather than changing the knowledge base while iterating over it.
+        inferred = {}
+        for sentence1, sentence2 in itertools.combinations(self.knowledge, 2):
+            if len(sentence1.cells) == len(sentence2.cells):
+                # only a subset when the cells are equal, which adds nothing new
+                continue
+            elif len(sentence1.cells) > len(sentence2.cells):
+                sentence1, sentence2 = sentence2, sentence1
+
+            if sentence1.cells <= sentence2.cells:
+                new_knowledge = Sentence(sentence2.cells - sentence1.cells, sentence2.count - sentence1.count)
+                if new_knowledge not in self.knowledge and new_knowledge not in inferred:
+                    print(f"Adding knowledge: {self._describe(new_knowledge)}")
+                    inferred[new_knowledge] = None
+
+        self.knowledge.update(inferred)
+
+        self._mark_known()
+
+        # self.log_cells(map(self._unpack, surrounding_indexes), f"MOVE {cell} {count}")
         # self.log_knowledge()
         # self.log_data()
 
@@ -341,10 +438,15 @@ class MinesweeperAI():
         and self.moves_made, but should not modify any of those values.
         """
 
-        moves = self.safes - self.moves_made
-        move = moves.pop() if len(moves) > 0 else None
-        # print(f"SAFE MOVE = {move}")
-        return move
+        # drop safe cells that have been chosen since they were found
+        while self._safe_moves and self._moves_made_mask[self._safe_moves[0]]:
+            self._safe_moves.popleft()
+
+        if not self._safe_moves:
+            return None
+
+        # print(f"SAFE MOVE = {self._unpack(self._safe_moves[0])}")
+        return self._unpack(self._safe_moves[0])
 
     def make_random_move(self):
         """
@@ -355,16 +457,11 @@ class MinesweeperAI():
         """
 
         # create a list of available cells that have not been chosen
-        cells = set()
-        for row in range(0, self.height):
-            for col in range(0, self.width):
-                cell = (row, col)
-                if cell not in self.moves_made and cell not in self.mines:
-                    cells.add((row, col))
+        cells = [index for index, available in enumerate(self._available_mask) if available]
 
         if len(cells) == 0:
             return None
 
-        move = cells.pop()
+        move = self._unpack(random.choice(cells))
         # print(f"RANDOM MOVE = {move}")
         return move
@@ -1,5 +1,7 @@
+import concurrent.futures
 import csv
 import itertools
+import os
 import sys
 
 PROBS = {
@@ -36,6 +38,13 @@ PROBS = {
     "mutation": 0.01
 }
 
+# PROBS["gene"] and PROBS["trait"] as lists indexed by number of genes (and trait), read in the inner loops
+GENE_PROBS = [PROBS["gene"][genes] for genes in range(3)]
+TRAIT_PROBS = [[PROBS["trait"][genes][False], PROBS["trait"][genes][True]] for genes in range(3)]
+
+# Below this many people starting worker processes costs more than the 3^N gene assignments
+PARALLEL_MIN_PEOPLE = 10
+
 
 def main():
 
@@ -44,8 +53,39 @@ def main():
         sys.exit("Usage: python heredity.py data.csv")
     people = load_data(sys.argv[1])
 
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
+    # Loop over all sets of people who might have one copy of the gene, each set is independent of the others
+    # so large families are split into chunks that are worked on in parallel
+    one_gene_masks = powerset_masks(len(people))
+
+    if len(people) < PARALLEL_MIN_PEOPLE:
+        probabilities = process_chunk(people, one_gene_masks)
+    else:
+        size = -(-len(one_gene_masks) // ((os.cpu_count() or 1) * 4))
+        chunks = [one_gene_masks[i:i + size] for i in range(0, len(one_gene_masks), size)]
+
+        probabilities = empty_probabilities(people)
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            for chunk_probabilities in executor.map(process_chunk, itertools.repeat(people), chunks):
+                merge(probabilities, chunk_probabilities)
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                print(f"    {value}: {p:.4f}")
+
+
+def empty_probabilities(people):
+    """
+    Return gene and trait probabilities of 0 for each person.
+    """
+    return {
         person: {
             "gene": {
                 2: 0,
@@ -60,38 +100,54 @@ def main():
         for person in people
     }
 
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
 
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
+def process_chunk(people, one_gene_masks):
+    """
+    Return the gene and trait probabilities of each person summed over every assignment of genes where the set
+    of people with one copy of the gene is one of `one_gene_masks`.
+    """
 
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
+    probabilities = empty_probabilities(people)
 
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
+    # Sets of people are bit masks, bit i is set when the i'th person in `people` is in the set
+    everyone = (1 << len(people)) - 1
 
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
+    # Check the known information once: the probability of each known trait given 0, 1 or 2 copies of the gene
+    evidence = [
+        (person, [TRAIT_PROBS[genes][data["trait"]] for genes in range(3)])
+        for person, data in people.items()
+        if data["trait"] is not None
+    ]
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+    # Loop over all sets of people who might have the gene
+    for one_gene in one_gene_masks:
+        for two_genes in submasks(everyone & ~one_gene):
+
+            # A person's trait only depends on their own genes, so rather than looping over all sets of people who
+            # might have the trait, weight the gene probability by the known traits and marginalize the unknown
+            # traits in closed form (their probabilities sum to 1).
+            genes = gene_counts(people, one_gene, two_genes)
+            p = gene_probability(people, genes)
+            for person, trait_probs in evidence:
+                p *= trait_probs[genes[person]]
+
+            # Update probabilities with new joint probability
+            update_marginal(probabilities, people, genes, p)
+
+    return probabilities
+
+
+def merge(probabilities, other):
+    """
+    Add the gene and trait probabilities in `other` to `probabilities`.
+    """
+
+    for person, data in other.items():
+        for field in data:
+            for value, p in data[field].items():
+                probabilities[person][field][value] += p
+
+    return
 
 
 def load_data(filename):
@@ -116,16 +172,30 @@ def load_data(filename):
     return data
 
 
-def powerset(s):
+def powerset_masks(n):
     """
-    Return a list of all possible subsets of set s.
+    Return all possible subsets of a set of n people as bit masks.
     """
-    s = list(s)
-    return [
-        set(s) for s in itertools.chain.from_iterable(
-            itertools.combinations(s, r) for r in range(len(s) + 1)
-        )
-    ]
+    return range(1 << n)
+
+
+def names_mask(people, names):
+    """
+    Return the bit mask for the set of `names`, bit i is set when the i'th person in `people` is in the set.
+    """
+    return sum(1 << i for i, person in enumerate(people) if person in names)
+
+
+def submasks(mask):
+    """
+    Yield all possible subsets of the bit mask `mask`, including the empty set.
+    """
+    submask = mask
+    while True:
+        yield submask
+        if submask == 0:
+            return
+        submask = (submask - 1) & mask
 
 
 def joint_probability(people, one_gene, two_genes, have_trait):
@@ -140,36 +210,40 @@ def joint_probability(people, one_gene, two_genes, have_trait):
         * everyone not in set` have_trait` does not have the trait.
     """
 
-    def inherited_from(parent):
-        """
-        Every child inherits one copy of the GJB2 gene from each of their parents.
-        - If a parent has two copies of the mutated gene, then they will pass the mutated gene on to the child;
-        - if a parent has no copies of the mutated gene, then they will not pass the mutated gene on to the child;
-        - and if a parent has one copy of the mutated gene, then the gene is passed on to the child with probability 0.5.
-        After a gene is passed on, though, it has some probability of undergoing additional mutation: changing from a
-        version of the gene that causes hearing impairment to a version that doesn’t, or vice versa.
-
-        Finally, PROBS["mutation"] is the probability that a gene mutates from being the gene in question to not being
-        that gene, and vice versa. If a mother has two versions of the gene, for example, and therefore passes one on
-        to her child, there’s a 1% chance it mutates into not being the target gene anymore. Conversely, if a mother
-        has no versions of the gene, and therefore does not pass it onto her child, there’s a 1% chance it mutates into
-        being the target gene. It’s therefore possible that even if neither parent has any copies of the gene in
-        question, their child might have 1 or even 2 copies of the gene.
-        """
-
-        if parent in one_gene:
-            return 0.5
-        elif parent in two_genes:
-            return 1 - PROBS["mutation"]  # not mutated
-        else:
-            return PROBS["mutation"]  # mutated
+    # main works with bit masks of people, turn the sets of names into them at the boundary
+    genes = gene_counts(people, names_mask(people, one_gene), names_mask(people, two_genes))
+    result = gene_probability(people, genes)
+
+    for person in people:
+        result *= TRAIT_PROBS[genes[person]][person in have_trait]
+
+    return result
+
+
+def gene_counts(people, one_gene, two_genes):
+    """
+    Return a dictionary mapping each person to the number of copies of the gene they have, given the bit masks
+    `one_gene` and `two_genes` where bit i is set when the i'th person in `people` is in the set.
+    """
+    return {
+        person: 2 if two_genes >> i & 1 else 1 if one_gene >> i & 1 else 0
+        for i, person in enumerate(people)
+    }
+
+
+def gene_probability(people, genes):
+    """
+    Compute and return the probability that everyone has the number of copies of the gene in `genes`,
+    regardless of who has the trait.
+    """
+
+    inheritance = INHERITANCE
+    gene_probs = GENE_PROBS
 
     result = 1
 
     for person, data in people.items():
 
-        genes = 2 if person in two_genes else 1 if person in one_gene else 0
-        trait = person in have_trait
         mother = data['mother']
         father = data['father']
 
@@ -178,37 +252,71 @@ def joint_probability(people, one_gene, two_genes, have_trait):
         # the gene, or vice versa).
         if mother and father:
 
-            probability_from_mother = inherited_from(data['mother'])
-            probability_from_father = inherited_from(data['father'])
-            # P(!a) = 1 - P(a)
-            probability_not_from_father = 1 - probability_from_father
-            probability_not_from_mother = 1 - probability_from_mother
-
-            match genes:
-                case 2:
-                    # Marginalization P(a, b) = P(a) * P(b)
-                    probability_parents = probability_from_mother * probability_from_father
-                case 1:
-                    # Marginalization P(a) = P(a, !b) + P(a!, b)
-                    probability_parents = ((probability_from_father * probability_not_from_mother) +
-                                           (probability_from_mother * probability_not_from_father))
-                case _:
-                    # Marginalization P(!a, !b) = P(!a) * P(!b)
-                    probability_parents = probability_not_from_father * probability_not_from_mother
-
-            probability = probability_parents * PROBS['trait'][genes][trait]
+            probability = inheritance[genes[mother]][genes[father]][genes[person]]
 
         # For anyone with no parents listed in the data set, use the probability distribution PROBS["gene"] to
         # determine the probability that they have a particular number of the gene.
         else:
 
-            probability = PROBS['gene'][genes] * PROBS['trait'][genes][trait]
+            probability = gene_probs[genes[person]]
 
         result *= probability
 
     return result
 
 
+def inheritance_table(mutation):
+    """
+    Return a table where table[mother][father][genes] is the probability that a child has `genes` copies of the
+    gene given the number of copies `mother` and `father` have.
+
+    Every child inherits one copy of the GJB2 gene from each of their parents.
+    - If a parent has two copies of the mutated gene, then they will pass the mutated gene on to the child;
+    - if a parent has no copies of the mutated gene, then they will not pass the mutated gene on to the child;
+    - and if a parent has one copy of the mutated gene, then the gene is passed on to the child with probability 0.5.
+    After a gene is passed on, though, it has some probability of undergoing additional mutation: changing from a
+    version of the gene that causes hearing impairment to a version that doesn’t, or vice versa.
+
+    Finally, `mutation` is the probability that a gene mutates from being the gene in question to not being
+    that gene, and vice versa. If a mother has two versions of the gene, for example, and therefore passes one on
+    to her child, there’s a 1% chance it mutates into not being the target gene anymore. Conversely, if a mother
+    has no versions of the gene, and therefore does not pass it onto her child, there’s a 1% chance it mutates into
+    being the target gene. It’s therefore possible that even if neither parent has any copies of the gene in
+    question, their child might have 1 or even 2 copies of the gene.
+    """
+
+    # Probability a parent with 0, 1 or 2 copies of the gene passes the gene on
+    passes = [
+        mutation,      # mutated
+        0.5,
+        1 - mutation   # not mutated
+    ]
+
+    table = []
+
+    for from_mother in passes:
+        row = []
+        for from_father in passes:
+            # P(!a) = 1 - P(a)
+            not_from_mother = 1 - from_mother
+            not_from_father = 1 - from_father
+            row.append([
+                # Marginalization P(!a, !b) = P(!a) * P(!b)
+                not_from_mother * not_from_father,
+                # Marginalization P(a) = P(a, !b) + P(a!, b)
+                from_father * not_from_mother + from_mother * not_from_father,
+                # Marginalization P(a, b) = P(a) * P(b)
+                from_mother * from_father
+            ])
+        table.append(row)
+
+    return table
+
+
+# Child gene probabilities for every combination of parent genes, shared by every joint probability
+INHERITANCE = inheritance_table(PROBS["mutation"])
+
+
 def update(probabilities, one_gene, two_genes, have_trait, p):
     """
     Add to `probabilities` a new joint probability `p`.
@@ -226,6 +334,28 @@ def update(probabilities, one_gene, two_genes, have_trait, p):
     return
 
 
+def update_marginal(probabilities, people, genes, p):
+    """
+    Add to `probabilities` the probability `p` of everyone having the number of copies of the gene in `genes`
+    along with the known traits in `people`.
+    Each person's "gene" distribution is updated for their number of genes, a known trait is updated with `p`
+    while an unknown trait is split between True and False by the probability of the trait given their genes.
+    """
+
+    for person, data in probabilities.items():
+        genes_count = genes[person]
+        trait = people[person]["trait"]
+        data['gene'][genes_count] += p
+
+        if trait is None:
+            data['trait'][True] += p * TRAIT_PROBS[genes_count][True]
+            data['trait'][False] += p * TRAIT_PROBS[genes_count][False]
+        else:
+            data['trait'][trait] += p
+
+    return
+
+
 def normalize(probabilities):
     """
     Update `probabilities` such that each probability distribution
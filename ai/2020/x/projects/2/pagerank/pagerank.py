@@ -1,3 +1,7 @@
+import bisect
+import concurrent.futures
+import itertools
+import operator
 import os
 import random
 import re
@@ -6,6 +10,15 @@ import sys
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Corpora up to this many pages are solved exactly, elimination is O(N^3) so beyond this iterating is faster
+DIRECT_SOLVE_PAGES = 16
+
+# Sampling at least this many pages is split into chains sampled in parallel, fewer are not worth starting processes
+PARALLEL_MIN_SAMPLES = 1000000
+
+# Links in a page, compiled once rather than on every page crawled
+LINK_PATTERN = re.compile(rb"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
 
 def transition_model_test():
 
@@ -44,21 +57,28 @@ def crawl(directory):
     for filename in os.listdir(directory):
         if not filename.endswith(".html"):
             continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
+        links = read_links(os.path.join(directory, filename))
+        pages[filename] = links - {filename}
 
     # Only include links to other pages in the corpus
     for filename in pages:
-        pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
-        )
+        pages[filename] &= pages.keys()
 
     return pages
 
 
+def read_links(path):
+    """
+    Return the set of links in the HTML file at `path`.
+    """
+
+    # Read the raw bytes, only the captured links need decoding
+    with open(path, "rb") as f:
+        contents = f.read()
+
+    return {link.decode() for link in LINK_PATTERN.findall(contents)}
+
+
 def transition_model(corpus, page, damping_factor):
     """
     Return a probability distribution over which page to visit next,
@@ -70,22 +90,53 @@ def transition_model(corpus, page, damping_factor):
     """
 
     N = len(corpus)
+    links = corpus[page]
+    num_links = len(links)
 
     # If page has no outgoing links, then transition_model should return a probability distribution that
     # chooses randomly among all pages with equal probability.
-    if len(corpus[page]) == 0:
-        return {page_name: 1 / N for page_name in corpus}
+    if num_links == 0:
+        return dict.fromkeys(corpus, 1 / N)
 
     # With probability 1 - d, the surfer chose a page at random and ended up on page p.
-    result = { page_name:  (1 - damping_factor) / N for page_name in corpus}
+    result = dict.fromkeys(corpus, (1 - damping_factor) / N)
 
     # With probability d, the surfer followed a link from a page i to page p.
-    for page_name in corpus[page]:
-        result[page_name] += damping_factor / len(corpus[page])
+    link_probability = damping_factor / num_links
+    for page_name in links:
+        result[page_name] += link_probability
 
     return result
 
 
+def transition_matrix(corpus, damping_factor):
+    """
+    Return the list of pages in the corpus and the transition matrix for the
+    corpus, where matrix[i][j] is the probability of visiting pages[j] next
+    given the current page is pages[i] (i.e. row i is the transition model of
+    pages[i]).
+    """
+
+    pages, indptr, indices = corpus_to_csr(corpus)
+    N = len(pages)
+    matrix = []
+
+    # Same model as transition_model, built straight into a row by page index rather than through a dict per page
+    for start, end in zip(indptr, indptr[1:]):
+        num_links = end - start
+
+        if num_links == 0:
+            matrix.append([1 / N] * N)
+            continue
+
+        row = [(1 - damping_factor) / N] * N
+        for linked in indices[start:end]:
+            row[linked] += damping_factor / num_links
+        matrix.append(row)
+
+    return pages, matrix
+
+
 def sample_pagerank(corpus, damping_factor, n):
     """
     Return PageRank values for each page by sampling `n` pages
@@ -96,33 +147,135 @@ def sample_pagerank(corpus, damping_factor, n):
     PageRank values should sum to 1.
     """
 
-    # initialize the results dictionary
-    result = {page_name: 0 for page_name in corpus}
+    # The transition model only depends on the current page, so build every page's transition model once up front
+    # rather than once per sample
+    pages, matrix = transition_matrix(corpus, damping_factor)
 
-    # The  first sample should be generated by choosing from a page at random.
-    current_page = random.choice(list(corpus.keys()))
+    # Turn each row into its cumulative distribution once, then a sample is one binary search for a random point in
+    # it (what random.choices does internally, without its per call argument handling)
+    cumulative = [list(itertools.accumulate(row)) for row in matrix]
+
+    # Every chain of samples settles on the same distribution, so a large number of samples is split into one chain
+    # per core that are walked in parallel, each from its own seed
+    if n < PARALLEL_MIN_SAMPLES:
+        counts = sample_chain(cumulative, n, random.getrandbits(64))
+    else:
+        chains = os.cpu_count() or 1
+        sizes = [n // chains + (i < n % chains) for i in range(chains)]
+        seeds = [random.getrandbits(64) for i in range(chains)]
+
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            chain_counts = list(executor.map(sample_chain, itertools.repeat(cumulative), sizes, seeds))
+
+        counts = [sum(page_counts) for page_counts in zip(*chain_counts)]
+
+    result = {page_name: count / n for page_name, count in zip(pages, counts)}
+
+    return result
+
+
+def sample_chain(cumulative, n, seed):
+    """
+    Return how many of `n` samples landed on each page, walking a single chain
+    of samples over the cumulative transition rows (see sample_pagerank) with
+    random numbers seeded by `seed`.
+    """
+
+    generator = random.Random(seed)
+    last = len(cumulative) - 1
 
-    for i in range(0, n):
+    # count how many samples landed on each page
+    counts = [0] * len(cumulative)
 
-        trans_model = transition_model(corpus, current_page, damping_factor)
+    if n == 0:
+        return counts
+
+    # The  first sample should be generated by choosing from a page at random.
+    current = generator.randrange(len(cumulative))
+    counts[current] += 1
 
-        # add the probabilities to the results and average them out
-        for page_name in trans_model:
-            result[page_name] += trans_model[page_name]
+    for i in range(1, n):
 
         # For each of the remaining samples,the next sample should be generated from the previous sample transition
-        # model probabilities. Use the weighted responses to choose the next current_page with some help from the
-        # python random choices function
-        current_page = random.choices(list(trans_model.keys()), weights=list(trans_model.values()), k=1).pop()
+        # model probabilities. The total of a row is ~1 but not exactly, so scale the random point by it
+        cdf = cumulative[current]
+        current = bisect.bisect(cdf, generator.random() * cdf[-1], 0, last)
+        counts[current] += 1
 
-    result = { k: v / n for k, v in result.items() }
+    return counts
 
-    return result
 
+def corpus_to_csr(corpus):
+    """
+    Return the links of the corpus as a sparse matrix in compressed rows, one row per page listing the pages it
+    links to:
 
-def page_rank(corpus, damping_factor, N, page_ranks):
+    pages: the list of pages in the corpus, a page is referred to by its index in the list
+    indptr: the links from pages[i] are at positions indptr[i] to indptr[i + 1] of indices
+    indices: the index of the page p the link is to
     """
-    Calculate the PageRank on the Corpus pages
+
+    pages = list(corpus)
+    index = {page_name: i for i, page_name in enumerate(pages)}
+
+    index_of = index.__getitem__
+
+    indptr = [0]
+    indices = []
+
+    for page_name in pages:
+        indices.extend(map(index_of, corpus[page_name]))
+        indptr.append(len(indices))
+
+    return pages, indptr, indices
+
+
+def link_matrix(corpus):
+    """
+    Return the link structure of the corpus as a sparse matrix in compressed rows, one row per page listing the
+    pages that link to it:
+
+    pages: the list of pages in the corpus, a page is referred to by its index in the list
+    indptr: the links to pages[p] are at positions indptr[p] to indptr[p + 1] of indices
+    indices: the index of the page i the link is from
+    weights: 1 / NumLinks(i) for every page i, 0 for pages with no links
+    dangling: the indexes of the pages with no links at all
+    """
+
+    # transpose the links from each page into the links to each page
+    pages, outptr, outdices = corpus_to_csr(corpus)
+
+    # the pages that link to each page
+    inbound = [[] for page_name in pages]
+    weights = []
+    dangling = []
+
+    for i, (start, end) in enumerate(zip(outptr, outptr[1:])):
+        num_links = end - start
+
+        if num_links == 0:
+            dangling.append(i)
+            weights.append(0)
+        else:
+            weights.append(1 / num_links)
+
+        for p in outdices[start:end]:
+            inbound[p].append(i)
+
+    indptr = [0]
+    indices = []
+
+    for links in inbound:
+        indices.extend(links)
+        indptr.append(len(indices))
+
+    return pages, indptr, indices, weights, dangling
+
+
+def page_rank(indptr, indices, weights, dangling, damping_factor, page_ranks):
+    """
+    Calculate the PageRank of every page from the current `page_ranks` given the link matrix of the corpus
+    (see link_matrix)
 
     Formula ...
     PR(p) = (1 - d / N) + d * SUM(0..i) { PR(i) / NumLinks(i) }
@@ -131,32 +284,25 @@ def page_rank(corpus, damping_factor, N, page_ranks):
     i ranges over all pages that link to page p
     NumLinks(i) is the number of links present on page i.
     """
-    results = {}
-
-    # PR(p)
-    for page_name in corpus:
-        sum_of_links = 0
 
-        # SUM(0..i) { PR(i) / NumLinks(i)
-        for i in corpus:
-            linked_pages = corpus[i]
-            num_links = len(corpus[i])
+    N = len(page_ranks)
 
-            # calculating a page’s PageRank based on the PageRanks of all pages that link to it
-            # PR(i) / NumLinks(i)
-            if page_name in linked_pages:  # link to page_name?
-                sum_of_links += page_ranks[i] / num_links
+    # A page that has no links at all should be interpreted as having one link for every page in the corpus
+    # PR(i) / N, this is the same for every page
+    dangling_links = sum(page_ranks[i] for i in dangling) / N
 
-            # A page that has no links at all should be interpreted as having one link for every page in the corpus
-            # PR(i) / N
-            if num_links == 0:  # no links?
-                sum_of_links += page_ranks[i] / N
+    # PR(i) / NumLinks(i) is what page i passes along each of its links, work it out once per page rather than once
+    # per link. The sum over the links into a page runs in map / sum rather than a generator, so the per link work
+    # stays out of the interpreter loop
+    contributions = list(map(operator.mul, page_ranks, weights))
+    contribution_of = contributions.__getitem__
+    random_surfer = (1 - damping_factor) / N
 
-        # PR(p) = (1 - d / N) + d * SUM(0..i) { PR(i) / NumLinks(i) }
-        PR = ((1 - damping_factor) / N) + (damping_factor * sum_of_links)
-        results[page_name] = PR
-
-    return results
+    # PR(p) = (1 - d / N) + d * SUM(0..i) { PR(i) / NumLinks(i) }
+    return [
+        random_surfer + damping_factor * (dangling_links + sum(map(contribution_of, indices[start:end])))
+        for start, end in zip(indptr, indptr[1:])
+    ]
 
 
 def iterate_pagerank(corpus, damping_factor):
@@ -169,28 +315,76 @@ def iterate_pagerank(corpus, damping_factor):
     PageRank values should sum to 1.
     """
 
+    if len(corpus) <= DIRECT_SOLVE_PAGES:
+        return solve_pagerank(corpus, damping_factor)
+
     converge_at = 0.001
     converged = False
-    N = len(corpus)
+
+    # Only follow the links into each page, built once rather than scanning every page's links for every page
+    pages, indptr, indices, weights, dangling = link_matrix(corpus)
+    N = len(pages)
 
     # start by assuming the PageRank of every page is 1 / N
-    page_ranks = {page_name: 1 / N for page_name in corpus}
+    page_ranks = [1 / N] * N
 
     while not converged:
 
-        results = page_rank(corpus, damping_factor, N, page_ranks)
+        results = page_rank(indptr, indices, weights, dangling, damping_factor, page_ranks)
 
-        max_diff = 1.0
+        # have we converged? (no PageRank value changed by more than converge_at), worked out in map / max so the per
+        # page subtract and abs stay out of the interpreter loop
+        max_diff = max(map(abs, map(operator.sub, results, page_ranks)))
+        converged = max_diff <= converge_at
 
-        for page_name, probability in results.items():
-            rank_change = abs(results[page_name] - page_ranks[page_name])
-            max_diff = max(rank_change, converge_at)
-            page_ranks[page_name] = probability
+        page_ranks = results
 
-        # have we converged?
-        converged = max_diff <= converge_at
+    return dict(zip(pages, page_ranks))
+
+
+def solve_pagerank(corpus, damping_factor):
+    """
+    Return the exact PageRank values for each page, the values iterate_pagerank
+    converges towards, by solving the PageRank formula as a system of linear
+    equations (one per page) with Gaussian elimination.
+    """
 
-    return page_ranks
+    pages, indptr, indices, weights, dangling = link_matrix(corpus)
+    N = len(pages)
+
+    # PR(p) - d * SUM(0..i) { PR(i) / NumLinks(i) } = (1 - d) / N, a page with no links links to every page
+    rows = []
+    for p in range(N):
+        row = [0.0] * N
+        row[p] = 1.0
+        for i in indices[indptr[p]:indptr[p + 1]]:
+            row[i] -= damping_factor * weights[i]
+        for i in dangling:
+            row[i] -= damping_factor / N
+        rows.append(row)
+
+    totals = [(1 - damping_factor) / N] * N
+
+    # Eliminate below the diagonal. Every column has a dominant diagonal (the damped link probabilities out of a
+    # page sum to at most d < 1) so no pivoting is needed
+    for k in range(N):
+        pivot_row = rows[k]
+        pivot = pivot_row[k]
+
+        for r in range(k + 1, N):
+            row = rows[r]
+            factor = row[k] / pivot
+            if factor:
+                row[k:] = [value - factor * pivot_value for value, pivot_value in zip(row[k:], pivot_row[k:])]
+                totals[r] -= factor * totals[k]
+
+    # Back substitution, from the last page up
+    page_ranks = [0.0] * N
+    for k in reversed(range(N)):
+        row = rows[k]
+        page_ranks[k] = (totals[k] - sum(map(operator.mul, row[k + 1:], page_ranks[k + 1:]))) / row[k]
+
+    return dict(zip(pages, page_ranks))
 
 
 if __name__ == "__main__":